@@ -6,8 +6,15 @@ from pathlib import Path
 
 def connect_db(sqlite_path: Path) -> sqlite3.Connection:
     sqlite_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(sqlite_path))
+    conn = sqlite3.connect(str(sqlite_path), isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -65536")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    conn.execute("PRAGMA wal_autocheckpoint = 1000")
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
@@ -20,6 +27,9 @@ def ensure_schema(conn: sqlite3.Connection) -> None:
             path TEXT NOT NULL UNIQUE,
             filename TEXT NOT NULL,
             sha256 TEXT NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            extractor_version INTEGER,
             page_count INTEGER NOT NULL,
             ingested_at TEXT NOT NULL
         );
@@ -32,5 +42,39 @@ def ensure_schema(conn: sqlite3.Connection) -> None:
         );
 
         CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents(sha256);
+
+        CREATE TABLE IF NOT EXISTS bm25_docs (
+            doc_index INTEGER PRIMARY KEY,
+            doc_id INTEGER NOT NULL,
+            page_index INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS bm25_terms (
+            term TEXT PRIMARY KEY,
+            idf REAL NOT NULL,
+            doc_indices BLOB NOT NULL,
+            weights BLOB NOT NULL
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS bm25_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID;
         """
     )
+
+    columns = {
+        str(row["name"]) for row in conn.execute("PRAGMA table_info(documents)")
+    }
+    if "size" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN size INTEGER")
+    if "mtime_ns" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN mtime_ns INTEGER")
+    if "extractor_version" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN extractor_version INTEGER")
+
+
+def optimize_db(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("PRAGMA optimize")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
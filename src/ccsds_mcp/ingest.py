@@ -2,8 +2,11 @@ from __future__ import annotations
 
 import hashlib
 import logging
+import os
 import re
 import sqlite3
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import UTC, datetime
 from pathlib import Path
@@ -11,10 +14,20 @@ from typing import Literal
 
 import pymupdf
 
-from ccsds_mcp.db import connect_db, ensure_schema
+from ccsds_mcp.db import connect_db, ensure_schema, optimize_db
+from ccsds_mcp.search import ensure_search_index
 
-SPACE_TAB_RE = re.compile(r"[ \t]+")
+MULTI_SPACE_RE = re.compile(r" {2,}")
 THREE_PLUS_NEWLINES_RE = re.compile(r"\n{3,}")
+INGEST_BATCH_SIZE = 32
+MAX_EXTRACT_WORKERS = 6
+EXTRACTOR_VERSION = 1
+EXTRACT_TASKS_PER_WORKER = 2
+TEXT_FLAGS = (
+    pymupdf.TEXTFLAGS_TEXT
+    & ~pymupdf.TEXT_PRESERVE_IMAGES
+    & ~pymupdf.TEXT_PRESERVE_LIGATURES
+)
 
 
 @dataclass(slots=True)
@@ -30,6 +43,25 @@ class IngestStats:
 class DocumentRow:
     doc_id: int
     sha256: str
+    size: int | None
+    mtime_ns: int | None
+    extractor_version: int | None
+
+
+@dataclass(slots=True)
+class ChangedDocument:
+    pdf_path: Path
+    sha256: str | None
+
+
+@dataclass(slots=True)
+class ExtractedDocument:
+    resolved_path: str
+    filename: str
+    sha256: str
+    size: int
+    mtime_ns: int
+    pages: list[str]
 
 
 @dataclass(slots=True)
@@ -39,33 +71,51 @@ class DocumentResult:
 
 
 def discover_pdfs(pdf_dir: Path) -> list[Path]:
-    pdfs: list[Path] = [
-        path
-        for path in pdf_dir.rglob("*")
-        if path.is_file() and path.suffix.lower() == ".pdf"
-    ]
+    pdfs: list[Path] = []
+    pending_dirs: list[str] = [str(pdf_dir)]
+    while pending_dirs:
+        try:
+            entries = os.scandir(pending_dirs.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                    pdfs.append(Path(entry.path))
     pdfs.sort(key=lambda path: str(path.resolve()))
     return pdfs
 
 
-def compute_sha256(data: bytes) -> str:
-    return hashlib.sha256(data).hexdigest()
+def compute_sha256(path: Path) -> str:
+    with path.open("rb") as handle:
+        return hashlib.file_digest(handle, "sha256").hexdigest()
 
 
 def normalize_text(text: str) -> str:
-    normalized = text.replace("\r\n", "\n").replace("\r", "\n")
-    normalized = SPACE_TAB_RE.sub(" ", normalized)
+    normalized = (
+        text.replace("\r\n", "\n").replace("\r", "\n").replace("\t", " ")
+    )
+    normalized = MULTI_SPACE_RE.sub(" ", normalized)
     normalized = THREE_PLUS_NEWLINES_RE.sub("\n\n", normalized)
     return normalized.strip()
 
 
-def extract_pages(pdf_bytes: bytes, source_path: Path) -> list[str]:
+def extract_pages(source_path: Path) -> list[str]:
     pages: list[str] = []
     try:
-        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as document:
+        with pymupdf.open(str(source_path), filetype="pdf") as document:
             for page_index in range(document.page_count):
                 page = document.load_page(page_index)
-                pages.append(normalize_text(page.get_text("text")))
+                if (
+                    page.first_annot is None
+                    and page.first_widget is None
+                    and not page.get_fonts()
+                ):
+                    pages.append("")
+                    continue
+                pages.append(normalize_text(page.get_text("text", flags=TEXT_FLAGS)))
     except Exception as exc:  # noqa: BLE001
         raise ValueError(f"Unable to read PDF '{source_path}': {exc}") from exc
     return pages
@@ -79,13 +129,23 @@ def load_existing_document(
     conn: sqlite3.Connection, resolved_path: str
 ) -> DocumentRow | None:
     cursor = conn.execute(
-        "SELECT doc_id, sha256 FROM documents WHERE path = ?",
+        """
+        SELECT doc_id, sha256, size, mtime_ns, extractor_version
+        FROM documents
+        WHERE path = ?
+        """,
         (resolved_path,),
     )
     row = cursor.fetchone()
     if row is None:
         return None
-    return DocumentRow(doc_id=int(row["doc_id"]), sha256=str(row["sha256"]))
+    return DocumentRow(
+        doc_id=int(row["doc_id"]),
+        sha256=str(row["sha256"]),
+        size=row["size"],
+        mtime_ns=row["mtime_ns"],
+        extractor_version=row["extractor_version"],
+    )
 
 
 def write_document(
@@ -93,69 +153,127 @@ def write_document(
     resolved_path: str,
     filename: str,
     sha256: str,
+    size: int,
+    mtime_ns: int,
     pages: list[str],
     existing: DocumentRow | None,
 ) -> Literal["ingested", "updated"]:
     ingested_at = utc_now_iso()
-    status: Literal["ingested", "updated"] = "ingested"
-    conn.execute("BEGIN")
+    status: Literal["ingested", "updated"] = (
+        "ingested" if existing is None else "updated"
+    )
+    conn.execute("SAVEPOINT write_document")
     try:
-        if existing is None:
-            cursor = conn.execute(
-                """
-                INSERT INTO documents(path, filename, sha256, page_count, ingested_at)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (resolved_path, filename, sha256, len(pages), ingested_at),
-            )
-            doc_id = int(cursor.lastrowid)
-        else:
-            status = "updated"
-            doc_id = existing.doc_id
-            conn.execute(
-                """
-                UPDATE documents
-                SET filename = ?, sha256 = ?, page_count = ?, ingested_at = ?
-                WHERE doc_id = ?
-                """,
-                (filename, sha256, len(pages), ingested_at, doc_id),
+        cursor = conn.execute(
+            """
+            INSERT INTO documents(
+                path,
+                filename,
+                sha256,
+                size,
+                mtime_ns,
+                extractor_version,
+                page_count,
+                ingested_at
             )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                filename = excluded.filename,
+                sha256 = excluded.sha256,
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                extractor_version = excluded.extractor_version,
+                page_count = excluded.page_count,
+                ingested_at = excluded.ingested_at
+            RETURNING doc_id
+            """,
+            (
+                resolved_path,
+                filename,
+                sha256,
+                size,
+                mtime_ns,
+                EXTRACTOR_VERSION,
+                len(pages),
+                ingested_at,
+            ),
+        )
+        doc_id = int(cursor.fetchone()["doc_id"])
+        conn.execute("DELETE FROM bm25_meta WHERE key = 'format_version'")
+        if existing is not None:
             conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
 
         conn.executemany(
             "INSERT INTO pages(doc_id, page_index, text) VALUES (?, ?, ?)",
-            [(doc_id, page_index, text) for page_index, text in enumerate(pages)],
+            ((doc_id, page_index, text) for page_index, text in enumerate(pages)),
         )
-        conn.commit()
-    except Exception:  # noqa: BLE001
-        conn.rollback()
+    except BaseException:
+        conn.execute("ROLLBACK TO write_document")
         raise
+    finally:
+        conn.execute("RELEASE write_document")
 
     return status
 
 
+def find_changed_document(
+    conn: sqlite3.Connection, pdf_path: Path
+) -> ChangedDocument | None:
+    resolved = pdf_path.resolve()
+    existing = load_existing_document(conn, str(resolved))
+    if existing is None or existing.extractor_version != EXTRACTOR_VERSION:
+        return ChangedDocument(pdf_path=pdf_path, sha256=None)
+    stat = resolved.stat()
+    if existing.size == stat.st_size and existing.mtime_ns == stat.st_mtime_ns:
+        return None
+    sha256 = compute_sha256(resolved)
+    if existing.sha256 != sha256:
+        return ChangedDocument(pdf_path=pdf_path, sha256=sha256)
+    conn.execute(
+        "UPDATE documents SET size = ?, mtime_ns = ? WHERE doc_id = ?",
+        (stat.st_size, stat.st_mtime_ns, existing.doc_id),
+    )
+    return None
+
+
+def extract_pages_for_file(
+    pdf_path: Path, sha256: str | None = None
+) -> ExtractedDocument:
+    resolved = pdf_path.resolve()
+    stat = resolved.stat()
+    return ExtractedDocument(
+        resolved_path=str(resolved),
+        filename=resolved.name,
+        sha256=sha256 if sha256 is not None else compute_sha256(resolved),
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        pages=extract_pages(resolved),
+    )
+
+
 def ingest_document(
     conn: sqlite3.Connection,
-    pdf_path: Path,
+    document: ExtractedDocument,
 ) -> DocumentResult:
-    resolved = pdf_path.resolve()
-    resolved_path = str(resolved)
-    pdf_bytes = resolved.read_bytes()
-    sha256 = compute_sha256(pdf_bytes)
-    existing = load_existing_document(conn, resolved_path)
-    if existing is not None and existing.sha256 == sha256:
+    existing = load_existing_document(conn, document.resolved_path)
+    if (
+        existing is not None
+        and existing.sha256 == document.sha256
+        and existing.extractor_version == EXTRACTOR_VERSION
+    ):
         return DocumentResult(status="skipped", page_count=0)
 
-    pages = extract_pages(pdf_bytes, resolved)
     status = write_document(
         conn=conn,
-        resolved_path=resolved_path,
-        filename=resolved.name,
-        sha256=sha256,
-        pages=pages,
+        resolved_path=document.resolved_path,
+        filename=document.filename,
+        sha256=document.sha256,
+        size=document.size,
+        mtime_ns=document.mtime_ns,
+        pages=document.pages,
         existing=existing,
     )
-    return DocumentResult(status=status, page_count=len(pages))
+    return DocumentResult(status=status, page_count=len(document.pages))
 
 
 def run_ingest(
@@ -173,21 +291,67 @@ def run_ingest(
     conn = connect_db(sqlite_path)
     try:
         ensure_schema(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        changed: deque[ChangedDocument] = deque()
         for pdf_path in pdfs:
             try:
-                result = ingest_document(conn, pdf_path)
-            except Exception as exc:  # noqa: BLE001
+                changed_document = find_changed_document(conn, pdf_path)
+            except OSError as exc:
                 stats.failed += 1
                 active_logger.error("Failed to ingest %s: %s", pdf_path, exc)
                 continue
-
-            if result.status == "ingested":
-                stats.ingested += 1
-            elif result.status == "updated":
-                stats.updated += 1
-            else:
+            if changed_document is None:
                 stats.skipped += 1
+            else:
+                changed.append(changed_document)
+
+        pending_writes = 0
+        max_workers = min(os.cpu_count() or 1, MAX_EXTRACT_WORKERS)
+        max_in_flight = max_workers * EXTRACT_TASKS_PER_WORKER
+        in_flight: deque[tuple[Path, Future[ExtractedDocument]]] = deque()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while changed or in_flight:
+                while changed and len(in_flight) < max_in_flight:
+                    changed_document = changed.popleft()
+                    in_flight.append(
+                        (
+                            changed_document.pdf_path,
+                            executor.submit(
+                                extract_pages_for_file,
+                                changed_document.pdf_path,
+                                changed_document.sha256,
+                            ),
+                        )
+                    )
+
+                pdf_path, future = in_flight.popleft()
+                try:
+                    result = ingest_document(conn, future.result())
+                except Exception as exc:  # noqa: BLE001
+                    stats.failed += 1
+                    active_logger.error("Failed to ingest %s: %s", pdf_path, exc)
+                    continue
+
+                if result.status == "ingested":
+                    stats.ingested += 1
+                elif result.status == "updated":
+                    stats.updated += 1
+                else:
+                    stats.skipped += 1
+                    continue
+
+                pending_writes += 1
+                if pending_writes >= INGEST_BATCH_SIZE:
+                    conn.commit()
+                    conn.execute("BEGIN IMMEDIATE")
+                    pending_writes = 0
+
+        conn.commit()
+        ensure_search_index(conn)
+        optimize_db(conn)
     finally:
+        if conn.in_transaction:
+            conn.commit()
         conn.close()
 
     return stats
@@ -5,20 +5,71 @@ import hashlib
 import html
 import json
 import re
+import shutil
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from html.parser import HTMLParser
 from pathlib import Path
 from tempfile import NamedTemporaryFile
+from typing import Literal
 from urllib.parse import unquote, urljoin, urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
 
 SOURCE_URL = "https://ccsds.org/publications/ccsdsallpubs/"
 OUTPUT_DIR = Path("src/ccsds_mcp/resources/pdfs")
 METADATA_PATH = OUTPUT_DIR / ".metadata.json"
 REQUEST_TIMEOUT = 30
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 DOWNLOAD_DELAY_SECONDS = 2.0
+REVALIDATION_DELAY_SECONDS = 0.2
+MAX_DOWNLOAD_WORKERS = 4
+METADATA_SAVE_INTERVAL = 25
 USER_AGENT = "ccsds-mcp-scraper/0.1 (+respectful-rate-limit)"
+ISO_EQUIVALENT_PREFIX_RE = re.compile(r"^ISO Equivalent\s*:\s*")
+ESCAPED_PDF_URL_RE = re.compile(r"https:\\/\\/[^\"'\s<>]+?\.pdf", re.IGNORECASE)
+
+
+class RequestThrottle:
+    def __init__(self, min_interval: float) -> None:
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self._next_start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_start = time.monotonic() + self.min_interval
+
+
+@dataclass(slots=True)
+class DownloadResult:
+    status: Literal["downloaded", "not_modified", "failed"]
+    remote: dict[str, str | int | None] | None = None
+    error: str = ""
+
+
+@dataclass(slots=True)
+class ScrapeStats:
+    downloaded: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+
+@dataclass(slots=True)
+class PendingDownload:
+    idx: int
+    url: str
+    filename: str
+    existed_before: bool
+    future: Future[DownloadResult]
 
 
 class LinkParser(HTMLParser):
@@ -59,6 +110,8 @@ class SnippetParser(HTMLParser):
 
 
 def parse_html_snippet(fragment: str) -> tuple[str, str | None]:
+    if "<" not in fragment and "&" not in fragment:
+        return " ".join(fragment.split()), None
     parser = SnippetParser()
     parser.feed(fragment)
     text = html.unescape(" ".join(" ".join(parser.text_parts).split()))
@@ -98,15 +151,21 @@ def filename_for_url(url: str, index: int) -> str:
 
 def filename_map_for_urls(urls: list[str]) -> dict[str, str]:
     mapping: dict[str, str] = {}
-    used_names: dict[str, str] = {}
+    used_names: set[str] = set()
     for idx, url in enumerate(urls, start=1):
+        if url in mapping:
+            continue
         candidate = filename_for_url(url, idx)
         assigned = candidate
-        if assigned in used_names and used_names[assigned] != url:
-            suffix = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+        if assigned in used_names:
             path = Path(candidate)
+            suffix = hashlib.blake2b(url.encode("utf-8"), digest_size=5).hexdigest()
             assigned = f"{path.stem}_{suffix}{path.suffix}"
-        used_names[assigned] = url
+            attempt = 1
+            while assigned in used_names:
+                attempt += 1
+                assigned = f"{path.stem}_{suffix}_{attempt}{path.suffix}"
+        used_names.add(assigned)
         mapping[url] = assigned
     return mapping
 
@@ -148,33 +207,8 @@ def extract_embedded_rows(html: str) -> list[list[str]]:
     if start < 0:
         return []
     i = start + len(key) - 1
-
-    depth = 0
-    in_string = False
-    escaping = False
-    end = -1
-    for pos, ch in enumerate(html[i:], start=i):
-        if in_string:
-            if escaping:
-                escaping = False
-            elif ch == "\\":
-                escaping = True
-            elif ch == '"':
-                in_string = False
-            continue
-        if ch == '"':
-            in_string = True
-        elif ch == "[":
-            depth += 1
-        elif ch == "]":
-            depth -= 1
-            if depth == 0:
-                end = pos + 1
-                break
-    if end < 0:
-        return []
     try:
-        parsed = json.loads(html[i:end])
+        parsed, _ = json.JSONDecoder().raw_decode(html, i)
     except json.JSONDecodeError:
         return []
     if not isinstance(parsed, list):
@@ -207,7 +241,7 @@ def extract_publications_from_rows(rows: list[list[str]]) -> dict[str, dict[str,
         description, _ = parse_html_snippet(row[7])
         working_group, working_group_href = parse_html_snippet(row[8])
         iso_equivalent, iso_equivalent_href = parse_html_snippet(row[9])
-        iso_equivalent = re.sub(r"^ISO Equivalent\s*:\s*", "", iso_equivalent).strip()
+        iso_equivalent = ISO_EQUIVALENT_PREFIX_RE.sub("", iso_equivalent).strip()
 
         publications[file_url] = {
             "file": file_text or filename_for_url(file_url, 1),
@@ -244,11 +278,7 @@ def fetch_publications(session: requests.Session) -> dict[str, dict[str, object]
     parser = LinkParser()
     parser.feed(html)
     resolved_urls = [urljoin(SOURCE_URL, href) for href in parser.hrefs]
-    escaped_urls = re.findall(
-        r"https:\\/\\/[^\"'\s<>]+?\.pdf",
-        html,
-        flags=re.IGNORECASE,
-    )
+    escaped_urls = ESCAPED_PDF_URL_RE.findall(html)
     resolved_urls.extend(url.replace("\\/", "/") for url in escaped_urls)
     urls = sorted({url for url in resolved_urls if is_allowed_pdf_url(url)})
     return {
@@ -271,14 +301,7 @@ def fetch_publications(session: requests.Session) -> dict[str, dict[str, object]
     }
 
 
-def head_metadata(
-    session: requests.Session, url: str
-) -> dict[str, str | int | None] | None:
-    try:
-        response = session.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-    except requests.RequestException:
-        return None
+def remote_metadata(response: requests.Response) -> dict[str, str | int | None]:
     content_length: int | None = None
     raw_length = response.headers.get("Content-Length")
     if raw_length and raw_length.isdigit():
@@ -290,26 +313,23 @@ def head_metadata(
     }
 
 
-def should_skip_download(
+def conditional_headers(
     destination: Path,
     saved: dict[str, object] | None,
-    remote: dict[str, str | int | None] | None,
     expected_filename: str,
-) -> bool:
-    if not destination.exists() or not saved or not remote:
-        return False
+) -> dict[str, str]:
+    if not destination.exists() or not saved:
+        return {}
     if str(saved.get("filename")) != expected_filename:
-        return False
-    etag = remote.get("etag")
-    last_modified = remote.get("last_modified")
-    if not etag or not last_modified:
-        return False
-    if str(saved.get("etag")) != etag or str(saved.get("last_modified")) != last_modified:
-        return False
-    remote_length = remote.get("content_length")
-    if remote_length is not None and saved.get("content_length") != remote_length:
-        return False
-    return True
+        return {}
+    headers: dict[str, str] = {}
+    etag = saved.get("etag")
+    if etag:
+        headers["If-None-Match"] = str(etag)
+    last_modified = saved.get("last_modified")
+    if last_modified:
+        headers["If-Modified-Since"] = str(last_modified)
+    return headers
 
 
 def build_metadata_record(
@@ -329,11 +349,21 @@ def build_metadata_record(
 
 
 def download_file(
-    session: requests.Session, url: str, destination: Path
-) -> tuple[bool, str]:
+    session: requests.Session,
+    url: str,
+    destination: Path,
+    headers: dict[str, str],
+    throttle: RequestThrottle | None = None,
+) -> DownloadResult:
     tmp_path: Path | None = None
+    if throttle is not None:
+        throttle.wait()
     try:
-        with session.get(url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        with session.get(
+            url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+        ) as response:
+            if response.status_code == 304:
+                return DownloadResult(status="not_modified")
             response.raise_for_status()
             with NamedTemporaryFile(
                 mode="wb",
@@ -342,20 +372,71 @@ def download_file(
                 suffix=".part",
                 delete=False,
             ) as tmp:
-                for chunk in response.iter_content(chunk_size=64 * 1024):
-                    if chunk:
-                        tmp.write(chunk)
                 tmp_path = Path(tmp.name)
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, tmp, length=DOWNLOAD_CHUNK_SIZE)
+            remote = remote_metadata(response)
         tmp_path.replace(destination)
-        return True, ""
-    except requests.RequestException as err:
+        return DownloadResult(status="downloaded", remote=remote)
+    except (requests.RequestException, Urllib3HTTPError) as err:
         if tmp_path is not None and tmp_path.exists():
             tmp_path.unlink(missing_ok=True)
-        return False, str(err)
+        return DownloadResult(status="failed", error=str(err))
     except OSError as err:
         if tmp_path is not None and tmp_path.exists():
             tmp_path.unlink(missing_ok=True)
-        return False, str(err)
+        return DownloadResult(status="failed", error=str(err))
+
+
+def record_download(
+    download: PendingDownload,
+    result: DownloadResult,
+    total: int,
+    metadata: dict[str, dict[str, object]],
+    publications: dict[str, dict[str, object]],
+    stats: ScrapeStats,
+) -> bool:
+    idx = download.idx
+    url = download.url
+    filename = download.filename
+    print(f"Processing PDF {idx} of {total}: {filename}")
+    if result.status == "failed":
+        print(f"ERROR [{idx}/{total}] {filename}: {result.error}")
+        stats.failed += 1
+        return False
+
+    if result.status == "not_modified":
+        metadata[url] = {
+            **metadata[url],
+            "publication": publications.get(url) or {},
+        }
+        print(f"SKIP [{idx}/{total}] {filename}")
+        stats.skipped += 1
+    else:
+        metadata[url] = build_metadata_record(
+            filename=filename,
+            remote=result.remote,
+            publication=publications.get(url),
+        )
+        if download.existed_before:
+            print(f"UPDATED [{idx}/{total}] {filename}")
+            stats.updated += 1
+        else:
+            print(f"GET [{idx}/{total}] {filename}")
+            stats.downloaded += 1
+    return True
+
+
+def build_session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+    adapter = HTTPAdapter(
+        pool_connections=MAX_DOWNLOAD_WORKERS,
+        pool_maxsize=MAX_DOWNLOAD_WORKERS * 2,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 def parse_args() -> argparse.Namespace:
@@ -379,8 +460,7 @@ def main() -> int:
 
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    session = requests.Session()
-    session.headers.update({"User-Agent": USER_AGENT})
+    session = build_session()
 
     try:
         publications = fetch_publications(session)
@@ -395,65 +475,70 @@ def main() -> int:
     name_map = filename_map_for_urls(urls)
     metadata = load_metadata()
 
-    downloaded_count = 0
-    updated_count = 0
-    skipped_count = 0
-    failed_count = 0
-
+    stats = ScrapeStats()
     total = len(urls)
-    for idx, url in enumerate(urls, start=1):
-        filename = name_map[url]
-        destination = OUTPUT_DIR / filename
-        saved = metadata.get(url)
-        remote = head_metadata(session, url)
-        print(f"Processing PDF {idx} of {total}: {filename}")
-
-        if should_skip_download(destination, saved, remote, filename):
-            metadata[url] = build_metadata_record(
-                filename=filename,
-                remote=remote,
-                publication=publications.get(url),
+    throttle = RequestThrottle(DOWNLOAD_DELAY_SECONDS)
+    revalidation_throttle = RequestThrottle(REVALIDATION_DELAY_SECONDS)
+    unsaved_records = 0
+    executor = ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS)
+    downloads: list[PendingDownload] = []
+    handled = 0
+    try:
+        for idx, url in enumerate(urls, start=1):
+            filename = name_map[url]
+            destination = OUTPUT_DIR / filename
+            headers = conditional_headers(destination, metadata.get(url), filename)
+            downloads.append(
+                PendingDownload(
+                    idx=idx,
+                    url=url,
+                    filename=filename,
+                    existed_before=destination.exists(),
+                    future=executor.submit(
+                        download_file,
+                        session,
+                        url,
+                        destination,
+                        headers,
+                        revalidation_throttle if headers else throttle,
+                    ),
+                )
             )
-            save_metadata(metadata)
-            print(f"SKIP [{idx}/{total}] {filename}")
-            skipped_count += 1
-            continue
-
-        existed_before = destination.exists()
-        print(f"Downloading PDF {idx} of {total}: {filename}")
-        success, error = download_file(session, url, destination)
-        if not success:
-            print(f"ERROR [{idx}/{total}] {filename}: {error}")
-            failed_count += 1
-            continue
 
-        refreshed = remote or head_metadata(session, url) or {}
-        metadata[url] = build_metadata_record(
-            filename=filename,
-            remote=refreshed,
-            publication=publications.get(url),
-        )
+        for download in downloads:
+            result = download.future.result()
+            handled += 1
+            if not record_download(
+                download, result, total, metadata, publications, stats
+            ):
+                continue
+
+            unsaved_records += 1
+            if unsaved_records >= METADATA_SAVE_INTERVAL:
+                save_metadata(metadata)
+                unsaved_records = 0
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        for download in downloads[handled:]:
+            future = download.future
+            if future.cancelled() or future.exception() is not None:
+                continue
+            record_download(
+                download, future.result(), total, metadata, publications, stats
+            )
+        raise
+    finally:
+        executor.shutdown()
         save_metadata(metadata)
 
-        if existed_before:
-            print(f"UPDATED [{idx}/{total}] {filename}")
-            updated_count += 1
-        else:
-            print(f"GET [{idx}/{total}] {filename}")
-            downloaded_count += 1
-
-        time.sleep(DOWNLOAD_DELAY_SECONDS)
-
-    save_metadata(metadata)
-
     print(f"Discovered PDFs: {len(urls)}")
-    print(f"Downloaded: {downloaded_count}")
-    print(f"Updated: {updated_count}")
-    print(f"Skipped: {skipped_count}")
-    print(f"Failed: {failed_count}")
+    print(f"Downloaded: {stats.downloaded}")
+    print(f"Updated: {stats.updated}")
+    print(f"Skipped: {stats.skipped}")
+    print(f"Failed: {stats.failed}")
     print(f"Metadata: {METADATA_PATH}")
 
-    return 0 if failed_count == 0 else 1
+    return 0 if stats.failed == 0 else 1
 
 
 if __name__ == "__main__":
@@ -1,25 +1,50 @@
 from __future__ import annotations
 
-import re
 import sqlite3
+import string
+from array import array
 from dataclasses import dataclass
 from pathlib import Path
 
-from rank_bm25 import BM25Okapi
+import numpy as np
 
 from ccsds_mcp.db import connect_db
 
-TOKEN_SPLIT_RE = re.compile(r"[^0-9A-Za-z]+")
-WHITESPACE_RE = re.compile(r"\s+")
+TOKEN_BYTES = frozenset((string.digits + string.ascii_lowercase).encode("ascii"))
+TOKEN_TRANSLATION = bytes(
+    byte if byte in TOKEN_BYTES else ord(" ") for byte in bytes(range(256)).lower()
+)
+SNIPPET_HEAD_FACTOR = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+BM25_INDEX_VERSION = 1
+POSTING_DOC_DTYPE = np.int32
+POSTING_WEIGHT_DTYPE = np.float32
 
 
 @dataclass(slots=True)
 class SearchDocument:
-    filename: str
-    path: str
+    doc_id: int
     page_index: int
-    text: str
-    tokens: list[str]
+
+
+@dataclass(slots=True)
+class SearchCorpus:
+    documents: list[SearchDocument]
+    term_ids: dict[str, int]
+    token_ids: array[int]
+    offsets: array[int]
+
+
+@dataclass(slots=True)
+class BM25Index:
+    doc_count: int
+    term_ids: dict[str, int]
+    idf: np.ndarray
+    offsets: np.ndarray
+    doc_indices: np.ndarray
+    weights: np.ndarray
 
 
 @dataclass(slots=True)
@@ -33,14 +58,22 @@ class SearchHit:
 
 
 def tokenize(text: str) -> list[str]:
-    return [token for token in TOKEN_SPLIT_RE.split(text.lower()) if token]
+    return (
+        text.encode("ascii", "replace")
+        .translate(TOKEN_TRANSLATION)
+        .decode("ascii")
+        .split()
+    )
 
 
 def make_snippet(text: str, max_chars: int = 240) -> str:
     if max_chars < 1:
         raise ValueError("max_chars must be at least 1")
 
-    single_line = WHITESPACE_RE.sub(" ", text).strip()
+    head = text[: max_chars * SNIPPET_HEAD_FACTOR]
+    single_line = " ".join(head.split())
+    if len(single_line) <= max_chars and len(head) < len(text):
+        single_line = " ".join(text.split())
     if len(single_line) <= max_chars:
         return single_line
     if max_chars <= 3:
@@ -48,86 +81,300 @@ def make_snippet(text: str, max_chars: int = 240) -> str:
     return f"{single_line[: max_chars - 3].rstrip()}..."
 
 
-def load_corpus(conn: sqlite3.Connection) -> list[SearchDocument]:
-    cursor = conn.execute(
+def load_corpus(conn: sqlite3.Connection) -> SearchCorpus:
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(
         """
-        SELECT p.doc_id, p.page_index, p.text, d.filename, d.path
+        SELECT p.doc_id, p.page_index, p.text
         FROM pages p
         JOIN documents d ON d.doc_id = p.doc_id
         ORDER BY d.filename ASC, p.page_index ASC, d.path ASC
         """
     )
 
-    corpus: list[SearchDocument] = []
-    for row in cursor:
-        text = str(row["text"])
-        corpus.append(
-            SearchDocument(
-                filename=str(row["filename"]),
-                path=str(row["path"]),
-                page_index=int(row["page_index"]),
-                text=text,
-                tokens=tokenize(text),
+    term_ids: dict[str, int] = {}
+    token_ids = array("I")
+    offsets = array("Q", [0])
+    documents: list[SearchDocument] = []
+    for doc_id, page_index, text in cursor:
+        documents.append(SearchDocument(doc_id=doc_id, page_index=page_index))
+        for token in tokenize(text):
+            token_ids.append(term_ids.setdefault(token, len(term_ids)))
+        offsets.append(len(token_ids))
+    return SearchCorpus(
+        documents=documents,
+        term_ids=term_ids,
+        token_ids=token_ids,
+        offsets=offsets,
+    )
+
+
+def build_bm25_index(corpus: SearchCorpus) -> BM25Index:
+    doc_count = len(corpus.documents)
+    term_count = len(corpus.term_ids)
+    lengths = np.diff(np.frombuffer(corpus.offsets, dtype=np.uint64).astype(np.int64))
+    token_ids = np.frombuffer(corpus.token_ids, dtype=np.uint32).astype(np.int64)
+    token_docs = np.repeat(np.arange(doc_count, dtype=np.int64), lengths)
+    keys, counts = np.unique(token_ids * doc_count + token_docs, return_counts=True)
+    terms, docs = np.divmod(keys, doc_count) if doc_count else (keys, keys)
+
+    tf = counts.astype(np.float64)
+    avgdl = float(lengths.sum()) / doc_count if doc_count else 0.0
+    if avgdl == 0.0:
+        avgdl = 1.0
+    norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl)
+    weights = tf * (BM25_K1 + 1) / (tf + norms[docs])
+
+    df = np.bincount(terms, minlength=term_count)
+    idf = np.log(doc_count - df + 0.5) - np.log(df + 0.5)
+    if idf.size:
+        idf[idf < 0] = BM25_EPSILON * idf.mean()
+
+    offsets = np.zeros(term_count + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+    return BM25Index(
+        doc_count=doc_count,
+        term_ids=corpus.term_ids,
+        idf=idf,
+        offsets=offsets,
+        doc_indices=docs,
+        weights=weights,
+    )
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    corpus = load_corpus(conn)
+    index = build_bm25_index(corpus)
+    doc_indices = index.doc_indices.astype(POSTING_DOC_DTYPE)
+    weights = index.weights.astype(POSTING_WEIGHT_DTYPE)
+    conn.execute("DELETE FROM bm25_docs")
+    conn.execute("DELETE FROM bm25_terms")
+    conn.executemany(
+        "INSERT INTO bm25_docs(doc_index, doc_id, page_index) VALUES (?, ?, ?)",
+        (
+            (doc_index, document.doc_id, document.page_index)
+            for doc_index, document in enumerate(corpus.documents)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO bm25_terms(term, idf, doc_indices, weights) VALUES (?, ?, ?, ?)",
+        (
+            (
+                term,
+                float(index.idf[term_id]),
+                doc_indices[
+                    index.offsets[term_id] : index.offsets[term_id + 1]
+                ].tobytes(),
+                weights[index.offsets[term_id] : index.offsets[term_id + 1]].tobytes(),
             )
-        )
-    return corpus
+            for term, term_id in index.term_ids.items()
+        ),
+    )
+    conn.execute(
+        """
+        INSERT INTO bm25_meta(key, value) VALUES ('format_version', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """,
+        (BM25_INDEX_VERSION,),
+    )
 
 
-def search_pages(sqlite_path: Path, query: str, top_k: int) -> list[SearchHit]:
-    if top_k <= 0:
-        raise ValueError("--top-k must be greater than 0")
-    if not sqlite_path.exists():
-        raise ValueError(f"SQLite database does not exist: {sqlite_path}")
-    if not sqlite_path.is_file():
-        raise ValueError(f"SQLite path is not a file: {sqlite_path}")
+def has_stored_index(conn: sqlite3.Connection) -> bool:
+    if (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bm25_meta'"
+        ).fetchone()
+        is None
+    ):
+        return False
+    version_row = conn.execute(
+        "SELECT value FROM bm25_meta WHERE key = 'format_version'"
+    ).fetchone()
+    return version_row is not None and version_row[0] == BM25_INDEX_VERSION
 
-    conn = connect_db(sqlite_path)
+
+def ensure_search_index(conn: sqlite3.Connection) -> None:
+    if has_stored_index(conn):
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        corpus = load_corpus(conn)
-    finally:
-        conn.close()
+        rebuild_search_index(conn)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
 
-    if not corpus:
-        return []
 
-    query_tokens = tokenize(query)
-    if not query_tokens:
-        return []
+def stored_postings(
+    conn: sqlite3.Connection, query_tokens: list[str]
+) -> dict[str, tuple[float, np.ndarray, np.ndarray]]:
+    unique_tokens = sorted(set(query_tokens))
+    placeholders = ", ".join("?" for _ in unique_tokens)
+    rows = conn.execute(
+        f"""
+        SELECT term, idf, doc_indices, weights
+        FROM bm25_terms
+        WHERE term IN ({placeholders})
+        """,
+        unique_tokens,
+    ).fetchall()
+    return {
+        str(row["term"]): (
+            float(row["idf"]),
+            np.frombuffer(row["doc_indices"], dtype=POSTING_DOC_DTYPE),
+            np.frombuffer(row["weights"], dtype=POSTING_WEIGHT_DTYPE),
+        )
+        for row in rows
+    }
+
 
-    bm25 = BM25Okapi([document.tokens for document in corpus])
-    scores = bm25.get_scores(query_tokens)
-
-    scored_indices: list[tuple[int, float]] = [
-        (index, float(score))
-        for index, score in enumerate(scores)
-        if float(score) > 0.0
-    ]
-    scored_indices.sort(
-        key=lambda item: (
-            -item[1],
-            corpus[item[0]].filename,
-            corpus[item[0]].page_index,
-            corpus[item[0]].path,
-            item[0],
+def index_postings(
+    index: BM25Index, query_tokens: list[str]
+) -> dict[str, tuple[float, np.ndarray, np.ndarray]]:
+    postings: dict[str, tuple[float, np.ndarray, np.ndarray]] = {}
+    for token in set(query_tokens):
+        term_id = index.term_ids.get(token)
+        if term_id is None:
+            continue
+        start = index.offsets[term_id]
+        end = index.offsets[term_id + 1]
+        postings[token] = (
+            float(index.idf[term_id]),
+            index.doc_indices[start:end],
+            index.weights[start:end],
         )
+    return postings
+
+
+def rank_postings(
+    postings: dict[str, tuple[float, np.ndarray, np.ndarray]],
+    query_tokens: list[str],
+    top_k: int,
+) -> list[tuple[int, float]]:
+    matched = [postings[token] for token in query_tokens if token in postings]
+    if not matched:
+        return []
+
+    doc_indices = np.concatenate([posting[1] for posting in matched])
+    contributions = np.concatenate(
+        [idf * weights.astype(np.float64) for idf, _, weights in matched]
     )
+    candidates, positions = np.unique(doc_indices, return_inverse=True)
+    scores = np.bincount(positions, weights=contributions)
+
+    positive = scores > 0.0
+    candidates = candidates[positive]
+    scores = scores[positive]
+    if candidates.size > top_k:
+        kth_score = np.partition(scores, -top_k)[-top_k]
+        keep = scores >= kth_score
+        candidates = candidates[keep]
+        scores = scores[keep]
+
+    order = np.lexsort((candidates, -scores))[:top_k]
+    return list(zip(candidates[order].tolist(), scores[order].tolist()))
+
+
+def stored_pages(
+    conn: sqlite3.Connection, doc_indices: list[int]
+) -> dict[int, tuple[int, int]]:
+    placeholders = ", ".join("?" for _ in doc_indices)
+    rows = conn.execute(
+        f"""
+        SELECT doc_index, doc_id, page_index
+        FROM bm25_docs
+        WHERE doc_index IN ({placeholders})
+        """,
+        doc_indices,
+    ).fetchall()
+    return {
+        int(row["doc_index"]): (int(row["doc_id"]), int(row["page_index"]))
+        for row in rows
+    }
+
+
+def load_hits(
+    conn: sqlite3.Connection, ranked: list[tuple[int, int, float]]
+) -> list[SearchHit]:
+    placeholders = ", ".join("(?, ?)" for _ in ranked)
+    rows = conn.execute(
+        f"""
+        SELECT p.doc_id, p.page_index, p.text, d.filename, d.path
+        FROM pages p
+        JOIN documents d ON d.doc_id = p.doc_id
+        WHERE (p.doc_id, p.page_index) IN (VALUES {placeholders})
+        """,
+        [value for doc_id, page_index, _ in ranked for value in (doc_id, page_index)],
+    ).fetchall()
+    by_page = {(int(row["doc_id"]), int(row["page_index"])): row for row in rows}
 
     hits: list[SearchHit] = []
-    for rank_index, (index, score) in enumerate(scored_indices[:top_k], start=1):
-        document = corpus[index]
+    for rank_index, (doc_id, page_index, score) in enumerate(ranked, start=1):
+        row = by_page[(doc_id, page_index)]
         hits.append(
             SearchHit(
                 rank_index=rank_index,
-                filename=document.filename,
-                path=document.path,
-                page_index=document.page_index,
+                filename=str(row["filename"]),
+                path=str(row["path"]),
+                page_index=page_index,
                 score=score,
-                snippet=make_snippet(document.text),
+                snippet=make_snippet(str(row["text"])),
             )
         )
     return hits
 
 
+def rank_hits(
+    conn: sqlite3.Connection, query_tokens: list[str], top_k: int
+) -> list[SearchHit]:
+    if has_stored_index(conn):
+        ranked = rank_postings(
+            stored_postings(conn, query_tokens), query_tokens, top_k
+        )
+        pages = stored_pages(conn, [doc_index for doc_index, _ in ranked])
+    else:
+        corpus = load_corpus(conn)
+        index = build_bm25_index(corpus)
+        ranked = rank_postings(index_postings(index, query_tokens), query_tokens, top_k)
+        pages = {
+            doc_index: (
+                corpus.documents[doc_index].doc_id,
+                corpus.documents[doc_index].page_index,
+            )
+            for doc_index, _ in ranked
+        }
+    if not ranked:
+        return []
+    return load_hits(
+        conn, [(*pages[doc_index], score) for doc_index, score in ranked]
+    )
+
+
+def search_pages(sqlite_path: Path, query: str, top_k: int) -> list[SearchHit]:
+    if top_k <= 0:
+        raise ValueError("--top-k must be greater than 0")
+    if not sqlite_path.exists():
+        raise ValueError(f"SQLite database does not exist: {sqlite_path}")
+    if not sqlite_path.is_file():
+        raise ValueError(f"SQLite path is not a file: {sqlite_path}")
+
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return []
+
+    conn = connect_db(sqlite_path)
+    try:
+        conn.execute("BEGIN")
+        try:
+            return rank_hits(conn, query_tokens, top_k)
+        finally:
+            conn.commit()
+    finally:
+        conn.close()
+
+
 def format_hits(hits: list[SearchHit]) -> list[str]:
     if not hits:
         return ["No results."]